@@ -1,54 +1,379 @@
 #!/usr/bin/env python3
 from strands import Agent, task
 import boto3
+from botocore.config import Config
 import pandas as pd
-from typing import Dict, List, Any
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.fs as pafs
+from typing import Dict, List, Any, Optional
 import json
+import io
+import gzip
+import hashlib
+import os
 from datetime import datetime, timedelta
 import asyncio
+import heapq
+import bisect
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+# Columns needed to rank DTO resources; everything else in the CUR is dropped
+CUR_DTO_COLUMNS = [
+    'lineItem/resourceId',
+    'product/serviceName',
+    'product/region',
+    'lineItem/blendedCost',
+    'lineItem/usageAmount'
+]
+
+# Columns used to recognise data transfer line items
+CUR_DTO_FILTER_COLUMNS = ['product/productFamily', 'lineItem/usageType']
+
+# Rows parsed per chunk when CUR CSVs are filtered locally
+CUR_CSV_CHUNKSIZE = 200_000
+
+# Default upper bound on S3 objects read concurrently by one analysis step
+MAX_CONCURRENT_FETCHES = 16
+
+# CUR reads are mostly S3 Select round-trips, so they tolerate more concurrency
+MAX_CONCURRENT_SELECTS = 32
+
+# Connections kept by the boto3 S3 client; headroom above the busiest worker pool
+S3_MAX_POOL_CONNECTIONS = 64
+
+# Fields of the default (version 2) VPC flow log record format
+VPC_FLOW_LOG_FIELDS = [
+    'version', 'account-id', 'interface-id', 'srcaddr', 'dstaddr', 'srcport', 'dstport',
+    'protocol', 'packets', 'bytes', 'start', 'end', 'action', 'log-status'
+]
+
+# A flow is identified by its endpoints and protocol
+FLOW_KEY_COLUMNS = ['srcaddr', 'dstaddr', 'protocol']
+
+# Rows parsed per chunk when reading text flow logs
+FLOW_LOG_CHUNKSIZE = 200_000
+
+# Per-service recommendations, matched in order against product/serviceName.
+# Resources above cost_threshold get one; above priority_threshold it is High priority.
+RECOMMENDATION_TEMPLATES = {
+    'EC2': {
+        'cost_threshold': 50,
+        'priority_threshold': 200,
+        'type': 'EC2 Data Transfer Optimization',
+        'recommendation': 'Implement VPC endpoints to reduce NAT gateway data transfer charges',
+        'implementation': 'Create VPC endpoints for frequently accessed AWS services',
+        'aws_documentation': 'https://docs.aws.amazon.com/vpc/latest/privatelink/vpc-endpoints.html',
+        'estimated_savings': 'Up to 50% reduction in data transfer costs'
+    },
+    'S3': {
+        'cost_threshold': 50,
+        'priority_threshold': 100,
+        'type': 'S3 Data Transfer Optimization',
+        'recommendation': 'Use CloudFront CDN or S3 Transfer Acceleration',
+        'implementation': 'Configure CloudFront distribution for frequently accessed objects',
+        'aws_documentation': 'https://docs.aws.amazon.com/AmazonCloudFront/latest/DeveloperGuide/Introduction.html',
+        'estimated_savings': 'Up to 60% reduction in data transfer costs'
+    },
+    'RDS': {
+        'cost_threshold': 50,
+        'priority_threshold': None,  # Always Medium
+        'type': 'RDS Data Transfer Optimization',
+        'recommendation': 'Optimize database queries and implement read replicas in same AZ',
+        'implementation': 'Create read replicas closer to application servers',
+        'aws_documentation': 'https://docs.aws.amazon.com/AmazonRDS/latest/UserGuide/USER_ReadRepl.html',
+        'estimated_savings': 'Up to 40% reduction in cross-AZ charges'
+    }
+}
+
+def _filter_dto_rows(df: pd.DataFrame, target_month: str) -> pd.DataFrame:
+    """Keep data transfer line items for the target month, projected to CUR_DTO_COLUMNS"""
+    if 'lineItem/usageStartDate' in df.columns:
+        # CUR timestamps are ISO-8601, so the month is the first seven characters
+        df = df[df['lineItem/usageStartDate'].str.slice(0, 7) == target_month]
+    
+    # Either marker column may be absent; category dtype scans each distinct value once
+    mask = pd.Series(False, index=df.index)
+    if 'product/productFamily' in df.columns:
+        mask |= df['product/productFamily'].astype('category').str.contains('Data Transfer', regex=False, na=False)
+    if 'lineItem/usageType' in df.columns:
+        mask |= df['lineItem/usageType'].astype('category').str.contains('DataTransfer', regex=False, na=False)
+    return df.loc[mask, CUR_DTO_COLUMNS]
+
+def _aggregate_flows(df: pd.DataFrame) -> pd.DataFrame:
+    """Sum bytes and count records per source/destination/protocol"""
+    return df.groupby(FLOW_KEY_COLUMNS, sort=False).agg(
+        total_bytes=('bytes', 'sum'),
+        flow_count=('bytes', 'size')
+    ).reset_index()
+
+async def _gather_in_threads(calls: List[tuple], max_workers: int = MAX_CONCURRENT_FETCHES) -> List[Any]:
+    """Run blocking (func, *args) calls on a dedicated pool of max_workers threads"""
+    loop = asyncio.get_running_loop()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        # Let every in-flight read finish before surfacing the first failure
+        results = await asyncio.gather(
+            *(loop.run_in_executor(executor, *call) for call in calls),
+            return_exceptions=True
+        )
+    for result in results:
+        if isinstance(result, BaseException):
+            raise result
+    return results
+
+def _overlapping_row_groups(metadata, match_values: List[str]) -> List[int]:
+    """Row groups whose srcaddr or dstaddr min/max range could hold one of match_values"""
+    wanted = sorted(match_values)
+    column_index = [metadata.schema.names.index(name) for name in ('srcaddr', 'dstaddr')]
+    
+    row_groups = []
+    for rg in range(metadata.num_row_groups):
+        for idx in column_index:
+            stats = metadata.row_group(rg).column(idx).statistics
+            # Without usable string statistics the row group has to be read
+            if stats is None or not stats.has_min_max or not isinstance(stats.min, str):
+                row_groups.append(rg)
+                break
+            # The smallest wanted value >= min must also be <= max
+            pos = bisect.bisect_left(wanted, stats.min)
+            if pos < len(wanted) and wanted[pos] <= stats.max:
+                row_groups.append(rg)
+                break
+    return row_groups
+
+def _detect_service(service: str) -> Optional[str]:
+    """Key of the first recommendation template whose name appears in the service name"""
+    return next((key for key in RECOMMENDATION_TEMPLATES if key in service), None)
+
+def _recommend_for_resource(resource: Dict) -> Optional[Dict]:
+    """Fill the service's recommendation template, or None if no template applies"""
+    service = resource.get('product/serviceName', '')
+    service_key = _detect_service(service)
+    if service_key is None:
+        return None
+    
+    template = RECOMMENDATION_TEMPLATES[service_key]
+    cost = resource.get('lineItem/blendedCost', 0)
+    if cost <= template['cost_threshold']:
+        return None
+    
+    high_priority = template['priority_threshold'] is not None and cost > template['priority_threshold']
+    return {
+        'resource_id': resource.get('lineItem/resourceId', ''),
+        'service': service,
+        'cost': cost,
+        'type': template['type'],
+        'priority': 'High' if high_priority else 'Medium',
+        'recommendation': template['recommendation'],
+        'implementation': template['implementation'],
+        'aws_documentation': template['aws_documentation'],
+        'estimated_savings': template['estimated_savings']
+    }
 
 class DTOCostAnalysisAgent(Agent):
-    def __init__(self):
+    def __init__(self, cache_dir: Optional[str] = None):
         super().__init__(
             name="DTO Cost Analysis Agent",
             description="Analyzes Data Transfer Out costs using CUR data and VPC Flow Logs"
         )
-        self.s3_client = boto3.client('s3')
+        self.s3_client = boto3.client('s3', config=Config(max_pool_connections=S3_MAX_POOL_CONNECTIONS))
         self.logs_client = boto3.client('logs')
+        self.s3_fs = pafs.S3FileSystem(region=self.s3_client.meta.region_name)
+        # Filtered CUR projections are cached here as Parquet when set
+        self.cache_dir = cache_dir
+
+    def _select_cur_object(self, bucket: str, key: str, target_month: str) -> pd.DataFrame:
+        """Filter a gzipped CUR CSV server-side with S3 Select and return only DTO rows"""
+        columns = ', '.join(f's."{column}"' for column in CUR_DTO_COLUMNS)
+        sql = (
+            f"SELECT {columns} FROM S3Object s "
+            f"WHERE s.\"lineItem/usageStartDate\" LIKE '{target_month}%' "
+            "AND (s.\"product/productFamily\" LIKE '%Data Transfer%' "
+            "OR s.\"lineItem/usageType\" LIKE '%DataTransfer%')"
+        )
+        response = self.s3_client.select_object_content(
+            Bucket=bucket,
+            Key=key,
+            ExpressionType='SQL',
+            Expression=sql,
+            InputSerialization={'CSV': {'FileHeaderInfo': 'USE'}, 'CompressionType': 'GZIP'},
+            OutputSerialization={'CSV': {}}
+        )
+        
+        buf = bytearray()
+        for event in response['Payload']:
+            if 'Records' in event:
+                buf.extend(event['Records']['Payload'])
+        
+        if not buf:
+            return pd.DataFrame(columns=CUR_DTO_COLUMNS)
+        return pd.read_csv(io.BytesIO(buf), names=CUR_DTO_COLUMNS)
+
+    def _read_cur_object(self, bucket: str, key: str, target_month: str) -> pd.DataFrame:
+        """Stream a CUR CSV in chunks and keep only the DTO rows of each chunk"""
+        obj_response = self.s3_client.get_object(Bucket=bucket, Key=key)
+        stream = obj_response['Body']
+        if key.endswith('.gz'):
+            stream = gzip.GzipFile(fileobj=stream)
+        
+        wanted = set(CUR_DTO_COLUMNS + CUR_DTO_FILTER_COLUMNS + ['lineItem/usageStartDate'])
+        survivors = [
+            _filter_dto_rows(chunk, target_month)
+            for chunk in pd.read_csv(
+                stream,
+                chunksize=CUR_CSV_CHUNKSIZE,
+                usecols=lambda c: c in wanted,
+                dtype={c: str for c in CUR_DTO_FILTER_COLUMNS + ['lineItem/usageStartDate']}
+            )
+        ]
+        survivors = [df for df in survivors if not df.empty]
+        
+        if not survivors:
+            return pd.DataFrame(columns=CUR_DTO_COLUMNS)
+        return pd.concat(survivors, ignore_index=True)
+
+    def _read_cur_parquet(self, bucket: str, keys: List[str], target_month: str) -> pd.DataFrame:
+        """Scan Parquet CUR objects decoding only the DTO columns for the target month"""
+        dataset = ds.dataset([f"{bucket}/{key}" for key in keys], filesystem=self.s3_fs, format='parquet')
+        
+        month_start = datetime.strptime(f"{target_month}-01", "%Y-%m-%d")
+        month_end = (month_start + timedelta(days=32)).replace(day=1)
+        usage_start_type = dataset.schema.field('lineItem/usageStartDate').type
+        if pa.types.is_timestamp(usage_start_type):
+            lower, upper = pa.scalar(month_start, type=usage_start_type), pa.scalar(month_end, type=usage_start_type)
+        else:
+            # ISO-8601 strings order the same way as the timestamps they encode
+            lower, upper = month_start.strftime('%Y-%m-%d'), month_end.strftime('%Y-%m-%d')
+        
+        usage_start = ds.field('lineItem/usageStartDate')
+        table = dataset.to_table(
+            columns=CUR_DTO_COLUMNS + [c for c in CUR_DTO_FILTER_COLUMNS if c in dataset.schema.names],
+            filter=(usage_start >= lower) & (usage_start < upper)
+        )
+        return _filter_dto_rows(table.to_pandas(), target_month)
+
+    def _read_flow_log_text(self, bucket: str, key: str, match_values: List[str]) -> List[Dict]:
+        """Parse a text flow log in chunks and aggregate the flows touching match_values"""
+        obj_response = self.s3_client.get_object(Bucket=bucket, Key=key)
+        reader = pd.read_csv(
+            obj_response['Body'],
+            sep=' ',
+            header=None,
+            names=VPC_FLOW_LOG_FIELDS,
+            usecols=FLOW_KEY_COLUMNS + ['bytes'],
+            dtype={'srcaddr': str, 'dstaddr': str, 'protocol': str, 'bytes': str},
+            chunksize=FLOW_LOG_CHUNKSIZE
+        )
+        
+        matched = [
+            chunk[chunk['srcaddr'].isin(match_values) | chunk['dstaddr'].isin(match_values)]
+            for chunk in reader
+        ]
+        if not matched:
+            return []
+        
+        flows = pd.concat(matched, ignore_index=True)
+        # NODATA/SKIPDATA records carry '-' instead of a byte count
+        flows['bytes'] = pd.to_numeric(flows['bytes'], errors='coerce').fillna(0).astype('int64')
+        return _aggregate_flows(flows).to_dict('records')
+
+    def _read_flow_log_parquet(self, bucket: str, key: str, match_values: List[str]) -> List[Dict]:
+        """Scan a parquet flow log, decoding only the flow columns of rows touching match_values"""
+        dataset = ds.dataset(f"{bucket}/{key}", filesystem=self.s3_fs, format='parquet')
+        fragment = next(dataset.get_fragments())
+        
+        # Skip the file, or individual row groups, when no address range can match
+        row_groups = _overlapping_row_groups(fragment.metadata, match_values)
+        if not row_groups:
+            return []
+        
+        table = fragment.subset(row_group_ids=row_groups).to_table(
+            schema=dataset.schema,
+            columns=FLOW_KEY_COLUMNS + ['bytes'],
+            filter=ds.field('srcaddr').isin(match_values) | ds.field('dstaddr').isin(match_values)
+        )
+        if table.num_rows == 0:
+            return []
+        
+        # Protocol is numeric in parquet but a string in text logs; align before grouping
+        table = table.set_column(
+            table.schema.get_field_index('protocol'), 'protocol', pc.cast(table['protocol'], pa.string())
+        )
+        summary = table.group_by(FLOW_KEY_COLUMNS).aggregate([
+            ('bytes', 'sum'),
+            ('bytes', 'count', pc.CountOptions(mode='all'))
+        ])
+        return [
+            {
+                'srcaddr': row['srcaddr'],
+                'dstaddr': row['dstaddr'],
+                'protocol': row['protocol'],
+                'total_bytes': row['bytes_sum'] or 0,
+                'flow_count': row['bytes_count']
+            }
+            for row in summary.to_pylist()
+        ]
 
     @task
     async def analyze_expensive_dto_resources(self, cur_bucket: str, cur_prefix: str, target_month: str, top_n: int = 10) -> List[Dict]:
         """Extract most expensive DTO resources from CUR data for specific month"""
-        response = self.s3_client.list_objects_v2(Bucket=cur_bucket, Prefix=cur_prefix)
+        paginator = self.s3_client.get_paginator('list_objects_v2')
+        pages = paginator.paginate(Bucket=cur_bucket, Prefix=cur_prefix, PaginationConfig={'PageSize': 1000})
         
-        cur_data = []
-        for obj in response.get('Contents', []):
-            if obj['Key'].endswith(('.csv', '.csv.gz')) and target_month in obj['Key']:
-                obj_response = self.s3_client.get_object(Bucket=cur_bucket, Key=obj['Key'])
-                df = pd.read_csv(obj_response['Body'], compression='gzip' if obj['Key'].endswith('.gz') else None)
-                cur_data.append(df)
+        calls = []
+        parquet_keys = []
+        etags = []
+        for page in pages:
+            for obj in page.get('Contents', []):
+                key = obj['Key']
+                if key.endswith('.parquet') and target_month in key:
+                    parquet_keys.append(key)
+                    etags.append(obj['ETag'])
+                elif key.endswith(('.csv', '.csv.gz')) and target_month in key:
+                    # Gzipped CUR is filtered by S3 Select; plain CSV is filtered locally
+                    reader = self._select_cur_object if key.endswith('.gz') else self._read_cur_object
+                    calls.append((reader, cur_bucket, key, target_month))
+                    etags.append(obj['ETag'])
         
-        if not cur_data:
-            return []
+        # CUR 2.0 is delivered as Parquet; CSV handling above covers legacy reports
+        if parquet_keys:
+            calls.append((self._read_cur_parquet, cur_bucket, parquet_keys, target_month))
         
-        combined_df = pd.concat(cur_data, ignore_index=True)
+        # The ETag set changes whenever AWS rewrites the month's report
+        cache_path = None
+        if self.cache_dir and etags:
+            cache_key = hashlib.sha1(','.join(sorted(etags)).encode()).hexdigest()
+            cache_path = os.path.join(self.cache_dir, f"cur-{target_month}-{cache_key}.parquet")
         
-        # Filter for specific month and data transfer costs
-        if 'lineItem/usageStartDate' in combined_df.columns:
-            combined_df['month'] = pd.to_datetime(combined_df['lineItem/usageStartDate']).dt.strftime('%Y-%m')
-            combined_df = combined_df[combined_df['month'] == target_month]
+        if cache_path and os.path.exists(cache_path):
+            dto_df = pd.read_parquet(cache_path)
+        else:
+            cur_data = [df for df in await _gather_in_threads(calls, MAX_CONCURRENT_SELECTS) if not df.empty]
+            if not cur_data:
+                return []
+            
+            dto_df = pd.concat(cur_data, ignore_index=True)
+            if cache_path:
+                os.makedirs(self.cache_dir, exist_ok=True)
+                dto_df.to_parquet(cache_path, compression='snappy')
         
-        dto_df = combined_df[
-            (combined_df.get('product/productFamily', '').str.contains('Data Transfer', na=False)) |
-            (combined_df.get('lineItem/usageType', '').str.contains('DataTransfer', na=False))
-        ]
+        # Group keys repeat heavily, so group on category codes instead of strings.
+        # Usage is downcast to float32; cost stays float64 to keep billing totals exact to the cent.
+        dto_df = dto_df.astype({
+            'lineItem/resourceId': 'category',
+            'product/serviceName': 'category',
+            'product/region': 'category',
+            'lineItem/usageAmount': 'float32'
+        })
         
         # Group by resource and calculate monthly costs
         expensive_resources = dto_df.groupby([
             'lineItem/resourceId', 
             'product/serviceName',
             'product/region'
-        ]).agg({
+        ], observed=True).agg({
             'lineItem/blendedCost': 'sum',
             'lineItem/usageAmount': 'sum'
         }).reset_index()
@@ -56,80 +381,61 @@ class DTOCostAnalysisAgent(Agent):
         return expensive_resources.nlargest(top_n, 'lineItem/blendedCost').to_dict('records')
 
     @task
-    async def correlate_vpc_flow_logs(self, resource_ids: List[str], s3_bucket: str, s3_prefix: str = "vpc-flow-logs/") -> Dict[str, Any]:
+    async def correlate_vpc_flow_logs(self, resource_ids: List[str], s3_bucket: str, s3_prefix: str = "vpc-flow-logs/", resource_ip_map: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
         """Analyze VPC flow logs from S3 text files for expensive resources"""
         if not resource_ids:
             return {'status': 'no_resources'}
         
         try:
             # List VPC flow log files in S3
-            response = self.s3_client.list_objects_v2(Bucket=s3_bucket, Prefix=s3_prefix)
+            paginator = self.s3_client.get_paginator('list_objects_v2')
+            pages = paginator.paginate(Bucket=s3_bucket, Prefix=s3_prefix, PaginationConfig={'PageSize': 1000})
             
-            if 'Contents' not in response:
+            flow_objects = []
+            for page in pages:
+                flow_objects.extend(
+                    obj for obj in page.get('Contents', [])
+                    if obj['Key'].endswith(('.txt', '.log', '.parquet'))
+                )
+                if len(flow_objects) >= 10:  # Limit to 10 files for performance
+                    break
+            
+            if not flow_objects:
                 return {'status': 'no_files', 'error': 'No VPC flow log files found'}
             
-            flows_data = []
-            resource_set = set(resource_ids)
+            match_values = resource_ids
+            if resource_ip_map:
+                # Flow logs record IP addresses, so match on the resources' IPs when they are known
+                ip_set = frozenset(resource_ip_map[rid] for rid in resource_ids if rid in resource_ip_map)
+                match_values = list(ip_set) or resource_ids
             
-            # Process flow log files
-            for obj in response['Contents'][:10]:  # Limit to 10 files for performance
+            # Process flow log files concurrently
+            calls = []
+            for obj in flow_objects[:10]:
                 if obj['Key'].endswith(('.txt', '.log')):
                     # Handle text format
-                    obj_response = self.s3_client.get_object(Bucket=s3_bucket, Key=obj['Key'])
-                    content = obj_response['Body'].read().decode('utf-8')
-                    
-                    for line in content.strip().split('\n'):
-                        if line.strip():
-                            fields = line.split()
-                            if len(fields) >= 14:  # Standard VPC flow log format
-                                srcaddr = fields[3]
-                                dstaddr = fields[4]
-                                bytes_transferred = int(fields[10]) if fields[10].isdigit() else 0
-                                protocol = fields[7]
-                                
-                                # Check if any resource ID matches source or destination
-                                if any(rid in srcaddr or rid in dstaddr for rid in resource_set):
-                                    flows_data.append({
-                                        'srcaddr': srcaddr,
-                                        'dstaddr': dstaddr,
-                                        'bytes': bytes_transferred,
-                                        'protocol': protocol
-                                    })
+                    calls.append((self._read_flow_log_text, s3_bucket, obj['Key'], match_values))
                 
                 elif obj['Key'].endswith('.parquet'):
                     # Handle parquet format
-                    obj_response = self.s3_client.get_object(Bucket=s3_bucket, Key=obj['Key'])
-                    df = pd.read_parquet(obj_response['Body'])
-                    
-                    # Filter for matching resource IDs
-                    mask = df['srcaddr'].isin(resource_set) | df['dstaddr'].isin(resource_set)
-                    filtered_df = df[mask]
-                    
-                    for _, row in filtered_df.iterrows():
-                        flows_data.append({
-                            'srcaddr': str(row['srcaddr']),
-                            'dstaddr': str(row['dstaddr']),
-                            'bytes': int(row['bytes']) if pd.notna(row['bytes']) else 0,
-                            'protocol': str(row['protocol'])
-                        })
+                    calls.append((self._read_flow_log_parquet, s3_bucket, obj['Key'], match_values))
+            
+            flows_data = [flow for flows in await _gather_in_threads(calls) for flow in flows]
             
-            # Aggregate flows by source/destination pairs
-            flow_summary = {}
+            # Merge per-file aggregates by source/destination pairs
+            bytes_by_key = defaultdict(int)
+            count_by_key = defaultdict(int)
             for flow in flows_data:
-                key = f"{flow['srcaddr']}-{flow['dstaddr']}-{flow['protocol']}"
-                if key not in flow_summary:
-                    flow_summary[key] = {
-                        'srcaddr': flow['srcaddr'],
-                        'dstaddr': flow['dstaddr'],
-                        'protocol': flow['protocol'],
-                        'total_bytes': 0,
-                        'flow_count': 0
-                    }
-                flow_summary[key]['total_bytes'] += flow['bytes']
-                flow_summary[key]['flow_count'] += 1
+                key = (flow['srcaddr'], flow['dstaddr'], flow['protocol'])
+                bytes_by_key[key] += flow['total_bytes']
+                count_by_key[key] += flow['flow_count']
             
-            # Sort by total bytes and return top flows
-            sorted_flows = sorted(flow_summary.values(), key=lambda x: x['total_bytes'], reverse=True)[:100]
+            # Return the top flows by total bytes
+            top_keys = heapq.nlargest(100, bytes_by_key, key=bytes_by_key.__getitem__)
+            sorted_flows = [
+                dict(zip(FLOW_KEY_COLUMNS, key), total_bytes=bytes_by_key[key], flow_count=count_by_key[key])
+                for key in top_keys
+            ]
             
             return {
                 'status': 'success',
@@ -143,53 +449,7 @@ class DTOCostAnalysisAgent(Agent):
     @task
     async def generate_aws_recommendations(self, expensive_resources: List[Dict], flow_analysis: Dict) -> List[Dict]:
         """Generate AWS best practice recommendations based on analysis"""
-        recommendations = []
-        
-        for resource in expensive_resources:
-            cost = resource.get('lineItem/blendedCost', 0)
-            service = resource.get('product/serviceName', '')
-            region = resource.get('product/region', '')
-            resource_id = resource.get('lineItem/resourceId', '')
-            
-            if cost > 50:  # Threshold for high-cost resources
-                if 'EC2' in service:
-                    recommendations.append({
-                        'resource_id': resource_id,
-                        'service': service,
-                        'cost': cost,
-                        'type': 'EC2 Data Transfer Optimization',
-                        'priority': 'High' if cost > 200 else 'Medium',
-                        'recommendation': 'Implement VPC endpoints to reduce NAT gateway data transfer charges',
-                        'implementation': 'Create VPC endpoints for frequently accessed AWS services',
-                        'aws_documentation': 'https://docs.aws.amazon.com/vpc/latest/privatelink/vpc-endpoints.html',
-                        'estimated_savings': f'Up to 50% reduction in data transfer costs'
-                    })
-                
-                elif 'S3' in service:
-                    recommendations.append({
-                        'resource_id': resource_id,
-                        'service': service,
-                        'cost': cost,
-                        'type': 'S3 Data Transfer Optimization',
-                        'priority': 'High' if cost > 100 else 'Medium',
-                        'recommendation': 'Use CloudFront CDN or S3 Transfer Acceleration',
-                        'implementation': 'Configure CloudFront distribution for frequently accessed objects',
-                        'aws_documentation': 'https://docs.aws.amazon.com/AmazonCloudFront/latest/DeveloperGuide/Introduction.html',
-                        'estimated_savings': f'Up to 60% reduction in data transfer costs'
-                    })
-                
-                elif 'RDS' in service:
-                    recommendations.append({
-                        'resource_id': resource_id,
-                        'service': service,
-                        'cost': cost,
-                        'type': 'RDS Data Transfer Optimization',
-                        'priority': 'Medium',
-                        'recommendation': 'Optimize database queries and implement read replicas in same AZ',
-                        'implementation': 'Create read replicas closer to application servers',
-                        'aws_documentation': 'https://docs.aws.amazon.com/AmazonRDS/latest/UserGuide/USER_ReadRepl.html',
-                        'estimated_savings': f'Up to 40% reduction in cross-AZ charges'
-                    })
+        recommendations = [rec for rec in map(_recommend_for_resource, expensive_resources) if rec]
         
         # Add flow-based recommendations
         if flow_analysis.get('status') == 'success':
@@ -213,7 +473,7 @@ class DTOCostAnalysisAgent(Agent):
         return recommendations
 
     @task
-    async def run_complete_analysis(self, cur_bucket: str, cur_prefix: str, target_month: str, vpc_logs_bucket: str, vpc_logs_prefix: str = "vpc-flow-logs/", top_n: int = 10) -> Dict[str, Any]:
+    async def run_complete_analysis(self, cur_bucket: str, cur_prefix: str, target_month: str, vpc_logs_bucket: str, vpc_logs_prefix: str = "vpc-flow-logs/", top_n: int = 10, resource_ip_map: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
         """Execute complete DTO cost analysis workflow for specific month"""
         
         # Step 1: Get expensive DTO resources from CUR for target month
@@ -227,8 +487,8 @@ class DTOCostAnalysisAgent(Agent):
             }
         
         # Step 2: Correlate with VPC flow logs
-        resource_ids = [r.get('lineItem/resourceId', '') for r in expensive_resources if r.get('lineItem/resourceId')]
-        flow_analysis = await self.correlate_vpc_flow_logs(resource_ids, vpc_logs_bucket, vpc_logs_prefix)
+        resource_ids = list(dict.fromkeys(r['lineItem/resourceId'] for r in expensive_resources if r.get('lineItem/resourceId')))
+        flow_analysis = await self.correlate_vpc_flow_logs(resource_ids, vpc_logs_bucket, vpc_logs_prefix, resource_ip_map)
         
         # Step 3: Generate recommendations
         recommendations = await self.generate_aws_recommendations(expensive_resources, flow_analysis)
@@ -3,9 +3,11 @@
 Generate dummy CUR data and VPC flow logs for testing DTO analysis
 """
 import pandas as pd
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
 import boto3
 import os
-import random
 from datetime import datetime, timedelta
 import gzip
 import io
@@ -27,41 +29,42 @@ def generate_cur_data(target_month="2024-01"):
         ("eni-1234567890abcdef0", "Amazon Virtual Private Cloud", "us-east-1")
     ]
     
-    # Generate CUR records
-    records = []
-    start_date = datetime.strptime(f"{target_month}-01", "%Y-%m-%d")
+    usage_type_templates = [
+        "{region}-DataTransfer-Out-Bytes",
+        "{region}-DataTransfer-Regional-Bytes",
+        "DataTransfer-Out-Bytes",
+        "{region}-NatGateway-Bytes"
+    ]
     
-    for day in range(1, 29):  # 28 days of data
-        current_date = start_date + timedelta(days=day-1)
-        date_str = current_date.strftime("%Y-%m-%d")
-        
-        for resource_id, service, region in resources:
-            # Generate multiple DTO-related usage types per resource
-            usage_types = [
-                f"{region}-DataTransfer-Out-Bytes",
-                f"{region}-DataTransfer-Regional-Bytes", 
-                f"DataTransfer-Out-Bytes",
-                f"{region}-NatGateway-Bytes"
-            ]
-            
-            for usage_type in usage_types:
-                if random.random() < 0.7:  # 70% chance of having this usage type
-                    cost = round(random.uniform(5, 500), 2)
-                    usage_amount = round(cost * random.uniform(100, 1000), 2)
-                    
-                    records.append({
-                        'lineItem/usageStartDate': date_str,
-                        'lineItem/usageEndDate': date_str,
-                        'lineItem/resourceId': resource_id,
-                        'lineItem/usageType': usage_type,
-                        'lineItem/blendedCost': cost,
-                        'lineItem/usageAmount': usage_amount,
-                        'product/serviceName': service,
-                        'product/region': region,
-                        'product/productFamily': 'Data Transfer' if 'DataTransfer' in usage_type else 'Compute Instance'
-                    })
-    
-    return pd.DataFrame(records)
+    # Generate CUR records for every day x resource x usage type at once
+    rng = np.random.default_rng()
+    start_date = datetime.strptime(f"{target_month}-01", "%Y-%m-%d")
+    dates = np.array([(start_date + timedelta(days=day)).strftime("%Y-%m-%d") for day in range(28)])  # 28 days of data
+    
+    resource_ids, services, regions = (np.array(column) for column in zip(*resources))
+    usage_types = np.array([[t.format(region=region) for t in usage_type_templates] for region in regions])
+    product_families = np.where(np.char.find(usage_types, 'DataTransfer') >= 0, 'Data Transfer', 'Compute Instance')
+    
+    day_idx, resource_idx, usage_idx = (
+        axis.ravel() for axis in np.indices((len(dates), len(resources), len(usage_type_templates)))
+    )
+    keep = rng.random(day_idx.size) < 0.7  # 70% chance of having each usage type
+    day_idx, resource_idx, usage_idx = day_idx[keep], resource_idx[keep], usage_idx[keep]
+    
+    cost = np.round(rng.uniform(5, 500, keep.sum()), 2)
+    usage_amount = np.round(cost * rng.uniform(100, 1000, cost.size), 2)
+    
+    return pd.DataFrame({
+        'lineItem/usageStartDate': dates[day_idx],
+        'lineItem/usageEndDate': dates[day_idx],
+        'lineItem/resourceId': resource_ids[resource_idx],
+        'lineItem/usageType': usage_types[resource_idx, usage_idx],
+        'lineItem/blendedCost': cost,
+        'lineItem/usageAmount': usage_amount,
+        'product/serviceName': services[resource_idx],
+        'product/region': regions[resource_idx],
+        'product/productFamily': product_families[resource_idx, usage_idx]
+    })
 
 def generate_vpc_flow_logs(resource_ids, target_month="2024-01"):
     """Generate dummy VPC flow logs"""
@@ -77,32 +80,38 @@ def generate_vpc_flow_logs(resource_ids, target_month="2024-01"):
     
     external_ips = ["203.0.113.1", "198.51.100.1", "192.0.2.1", "8.8.8.8", "1.1.1.1"]
     
-    logs = []
+    # Draw every field as an array: 7 days x 100 flows per day
+    rng = np.random.default_rng()
+    days, flows_per_day = 7, 100
+    n = days * flows_per_day
     start_date = datetime.strptime(f"{target_month}-01", "%Y-%m-%d")
-    
-    for day in range(1, 8):  # 7 days of flow logs
-        current_date = start_date + timedelta(days=day-1)
-        timestamp = int(current_date.timestamp())
-        
-        for _ in range(100):  # 100 flows per day
-            src_ip = random.choice(list(ip_mappings.values()) + external_ips)
-            dst_ip = random.choice(list(ip_mappings.values()) + external_ips)
-            
-            # Ensure some flows involve our resources
-            if random.random() < 0.6:
-                if random.random() < 0.5:
-                    src_ip = random.choice(list(ip_mappings.values()))
-                else:
-                    dst_ip = random.choice(list(ip_mappings.values()))
-            
-            bytes_transferred = random.randint(1000, 100000000)  # 1KB to 100MB
-            protocol = random.choice([6, 17, 1])  # TCP, UDP, ICMP
-            
-            # VPC Flow Log format: version account-id interface-id srcaddr dstaddr srcport dstport protocol packets bytes windowstart windowend action flowlogstatus
-            log_entry = f"2 123456789012 eni-1234567890abcdef0 {src_ip} {dst_ip} {random.randint(1024, 65535)} {random.choice([80, 443, 22, 3306, 5432])} {protocol} {random.randint(1, 100)} {bytes_transferred} {timestamp} {timestamp + 60} ACCEPT OK"
-            logs.append(log_entry)
-    
-    return logs
+    day_starts = np.array([int((start_date + timedelta(days=day)).timestamp()) for day in range(days)])
+    timestamps = np.repeat(day_starts, flows_per_day)
+    
+    resource_ips = np.array(list(ip_mappings.values()))
+    all_ips = np.concatenate([resource_ips, external_ips])
+    src_ips = rng.choice(all_ips, n)
+    dst_ips = rng.choice(all_ips, n)
+    
+    # Ensure some flows involve our resources
+    involve = rng.random(n) < 0.6
+    pin_src = involve & (rng.random(n) < 0.5)
+    pin_dst = involve & ~pin_src
+    src_ips = np.where(pin_src, rng.choice(resource_ips, n), src_ips)
+    dst_ips = np.where(pin_dst, rng.choice(resource_ips, n), dst_ips)
+    
+    src_ports = rng.integers(1024, 65535, n, endpoint=True)
+    dst_ports = rng.choice([80, 443, 22, 3306, 5432], n)
+    protocols = rng.choice([6, 17, 1], n)  # TCP, UDP, ICMP
+    packets = rng.integers(1, 100, n, endpoint=True)
+    bytes_transferred = rng.integers(1000, 100000000, n, endpoint=True)  # 1KB to 100MB
+    
+    # VPC Flow Log format: version account-id interface-id srcaddr dstaddr srcport dstport protocol packets bytes windowstart windowend action flowlogstatus
+    line_template = "2 123456789012 eni-1234567890abcdef0 {} {} {} {} {} {} {} {} {} ACCEPT OK"
+    return [
+        line_template.format(*fields)
+        for fields in zip(src_ips, dst_ips, src_ports, dst_ports, protocols, packets, bytes_transferred, timestamps, timestamps + 60)
+    ]
 
 def upload_to_s3(bucket_name, key, content, is_gzip=False):
     """Upload content to S3"""
@@ -176,24 +185,18 @@ def main():
     
     flow_df = pd.DataFrame(flow_records)
     
-    # Save parquet to local file then upload
-    parquet_file = f"/tmp/flow-logs-{target_month}.parquet"
-    flow_df.to_parquet(parquet_file)
-    
-    with open(parquet_file, 'rb') as f:
-        parquet_content = f.read()
+    # Serialize parquet in memory and upload
+    sink = pa.BufferOutputStream()
+    pq.write_table(pa.Table.from_pandas(flow_df), sink, compression='snappy')
     
     vpc_parquet_key = f"vpc-flow-logs/{target_month}/flow-logs.parquet"
     s3 = boto3.client('s3')
     try:
-        s3.put_object(Bucket=vpc_logs_bucket, Key=vpc_parquet_key, Body=parquet_content)
+        s3.put_object(Bucket=vpc_logs_bucket, Key=vpc_parquet_key, Body=sink.getvalue().to_pybytes())
         print(f"✓ Uploaded {vpc_parquet_key} to s3://{vpc_logs_bucket}/")
     except Exception as e:
         print(f"✗ Failed to upload parquet: {e}")
     
-    # Clean up temp file
-    os.remove(parquet_file)
-    
     print("\n" + "=" * 50)
     print("Test data generation complete!")
     print(f"CUR records: {len(cur_df)}")
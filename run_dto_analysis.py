@@ -5,8 +5,6 @@ import os
 from dto_strands_agent import DTOCostAnalysisAgent
 
 async def main():
-    agent = DTOCostAnalysisAgent()
-    
     # Get configuration from environment variables or use defaults
     cur_bucket = os.getenv('CUR_BUCKET', 'your-cur-bucket-name')
     cur_prefix = os.getenv('CUR_PREFIX', 'cur-reports/')
@@ -14,6 +12,9 @@ async def main():
     vpc_logs_bucket = os.getenv('VPC_LOGS_BUCKET', 'your-vpc-logs-bucket')
     vpc_logs_prefix = os.getenv('VPC_LOGS_PREFIX', 'vpc-flow-logs/')
     top_n = int(os.getenv('TOP_N', '10'))
+    cache_dir = '.cache' if os.getenv('DTO_CACHE') == '1' else None
+    
+    agent = DTOCostAnalysisAgent(cache_dir=cache_dir)
     
     print(f"Analyzing DTO costs for {target_month}...")
     print(f"CUR Bucket: {cur_bucket}")